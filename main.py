@@ -8,7 +8,7 @@ import sys
 import subprocess
 from argparse import ArgumentParser
 from functools import cached_property
-from multiprocessing import cpu_count, freeze_support
+from multiprocessing import cpu_count, freeze_support, get_start_method
 from multiprocessing.pool import Pool
 from pathlib import Path
 from typing import Union, Optional, List
@@ -57,6 +57,16 @@ class Download:
         if self.is_test:
             console.waiting = False
 
+    def __getstate__(self) -> dict:
+        """
+        Drop the card list when pickling, each pool task only needs its own card.
+        @return: Instance attributes to pickle.
+        """
+        state = self.__dict__.copy()
+        state.pop("cards", None)
+        state.pop("_list", None)
+        return state
+
     """
     PROPERTIES
     """
@@ -114,9 +124,17 @@ class Download:
                 f"{Fore.GREEN}---- Downloading {len(self.cards)} cards! ----{Style.RESET_ALL}"
             )
 
-        # Create a pool to execute these downloads
+        # Create known download folders before the pool forks its workers
+        dl.preflight_dirs(self.cards)
+
+        # Look up MTGP codes up front, forked workers inherit the results
+        if not cfg.only_scryfall and get_start_method() == "fork":
+            dl.prefetch_mtgp_codes(self.cards)
+
+        # Create a pool to execute these downloads, handing out one card at a time
+        # so a slow card never holds up a batch of cards queued behind it
         with Pool(processes=cpu_count()) as pool:
-            downloads = pool.map(self.stage_download, self.cards)
+            downloads = pool.map(self.stage_download, self.cards, chunksize=1)
 
         # Build results list
         results = []
@@ -2,23 +2,101 @@
 CARD CLASSES
 """
 import os
-from functools import cached_property
-from typing import Optional
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from threading import Lock
+from typing import Any, Callable, Generic, Optional, TypeVar, Union
 
 from pathvalidate import sanitize_filename
-import requests
 from pathlib import Path
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
 from unidecode import unidecode
 from src import settings as cfg
 from src import core
 from src.constants import con
 from src.core import log_failed, log_mtgp, log_scryfall
-from src.fetch import get_scryfall_image, get_mtgp_image, get_mtgp_page
+from src.fetch import (
+    get_scryfall_image,
+    get_mtgp_image,
+    get_mtgp_page,
+    get_mtgp_card_exists,
+)
 from src.types import DownloadResult
 
 cwd = os.getcwd()
 
+# Attributes identifying card art thumbnails on an MTGP card page
+MTGP_IMG_ATTRS: dict[str, Any] = {
+    "style": "display:block;border:4px black solid;cursor:pointer;"
+}
+
+# Frames saved under the classic template folder
+CLASSIC_FRAMES = frozenset(("1993", "1995"))
+
+# Frame effects that get their own template folder
+TEMPLATE_EFFECTS = frozenset(
+    ("enchantment", "miracle", "colorshifted", "extendedart", "etched", "snow")
+)
+
+# Set names grouped under a single MTGP promo set
+PROMO_SET_NAMES = {
+    "Legacy Championship": "uni",
+    "Vintage Championship": "uni",
+}
+
+# Naming convention tokens and literal braces, mapped to format template fields
+NAMING_TOKENS = re.compile(r"NAME|ARTIST|SET|NUMBER|[{}]")
+NAMING_FIELDS = {
+    "NAME": "{name}",
+    "ARTIST": "{artist}",
+    "SET": "{set}",
+    "NUMBER": "{number}",
+    "{": "{{",
+    "}": "}}",
+}
+
+# Guards cached lookups shared by card sides downloading at the same time
+face_lock = Lock()
+
+# Set types that may be missing from MTGP and fall back to its promo set
+PROBED_SET_TYPES = frozenset(("funny", "promo"))
+
+# Whether each probed set is listed on MTGP
+mtgp_probed_sets: dict[str, bool] = {}
+
+# Folders already created by this process
+_ensured_dirs: set[str] = set()
+
+# Known file names in each download folder, used to number duplicates
+_dir_files: dict[str, set[str]] = {}
+
+T = TypeVar("T")
+
+
+"""
+DESCRIPTORS
+"""
+
+
+class _cached(Generic[T]):
+    """
+    Minimal cached_property, stores the value on first access without taking a lock.
+    """
+
+    def __init__(self, func: Callable[[Any], T]) -> None:
+        self.func = func
+        self.name = func.__name__
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> T:
+        if instance is None:
+            return self  # type: ignore[return-value]
+        value = instance.__dict__[self.name] = self.func(instance)
+        return value
+
 
 """
 CARD CLASSES
@@ -41,39 +119,31 @@ class Card:
         self.path_back = template
 
         # Create download folders if needed
-        Path(os.path.join(cfg.mtgp, self.path)).mkdir(
-            mode=511, parents=True, exist_ok=True
-        )
-        Path(os.path.join(cfg.scry, self.path)).mkdir(
-            mode=511, parents=True, exist_ok=True
-        )
+        ensure_dir(f"{cfg.mtgp}/{self.path}")
+        ensure_dir(f"{cfg.scry}/{self.path}")
 
         # Setup backs folder if needed
-        if self.path_back:
-            Path(os.path.join(cfg.mtgp, self.path_back)).mkdir(
-                mode=511, parents=True, exist_ok=True
-            )
-            Path(os.path.join(cfg.scry, self.path_back)).mkdir(
-                mode=511, parents=True, exist_ok=True
-            )
+        if self.path_back and self.path_back != self.path:
+            ensure_dir(f"{cfg.mtgp}/{self.path_back}")
+            ensure_dir(f"{cfg.scry}/{self.path_back}")
 
     """
     PROPERTIES
     """
 
-    @property
+    @_cached
     def set(self) -> str:
         return self.c.get("set", "")
 
-    @property
+    @_cached
     def name(self) -> str:
         return self.c.get("name", "")
 
-    @property
+    @_cached
     def artist(self) -> str:
         return unidecode(self.c.get("artist", ""))
 
-    @property
+    @_cached
     def number(self) -> str:
         return self.c.get("collector_number", "")
 
@@ -85,7 +155,7 @@ class Card:
     def set_type(self) -> str:
         return self.c.get("set_type", "")
 
-    @property
+    @_cached
     def label(self) -> str:
         return f"{self.name} ({self.set.upper()}) {self.number}"
 
@@ -109,7 +179,7 @@ class Card:
     def mtgp_name(self) -> str:
         return self.name
 
-    @cached_property
+    @_cached
     def mtgp_code(self) -> str:
         """
         Get the correct mtgp URL code
@@ -126,7 +196,7 @@ class Card:
             return code
         return self.set + self.number
 
-    @cached_property
+    @_cached
     def mtgp_set(self) -> str:
         # Acquire MTGP appropriate set code
         mtgp_set = self.set
@@ -137,52 +207,53 @@ class Card:
         if mtgp_set in con.promo_sets:
             self.promo = True
             return mtgp_set
-        if "Alchemy" in self.set_name:
+        if promo_set := PROMO_SET_NAMES.get(self.set_name):
+            self.promo = True
+            return promo_set
+        if self.set_name.startswith("Alchemy"):
             self.promo = True
             return "a22"
-        if "Judge Gift" in self.set_name or mtgp_set == "dci":
+        if self.set_name.startswith("Judge Gift") or mtgp_set == "dci":
             self.promo = True
             return "dci"
-        if self.set_name in ("Legacy Championship", "Vintage Championship"):
-            self.promo = True
-            return "uni"
-        if self.set_type in ["funny", "promo"]:
+        if self.set_type in PROBED_SET_TYPES:
             # Does this set exist on MTG Pics?
-            if get_mtgp_page(f"https://www.mtgpics.com/card?ref={mtgp_set}001"):
+            if mtgp_set_exists(mtgp_set):
                 return mtgp_set
             self.promo = True
             return "pmo"
         return mtgp_set
 
-    @cached_property
+    @_cached
+    def mtgp_images(self) -> list[Tag]:
+        # Art thumbnails listed on the MTGP card page, fetched once per card
+        html = get_mtgp_page(f"https://www.mtgpics.com/card?ref={self.mtgp_code}")
+        if html is None:
+            return []
+        return BeautifulSoup(html, "lxml").find_all("img", MTGP_IMG_ATTRS)
+
+    @_cached
     def mtgp_url(self) -> Optional[str]:
         # Acquire best download link for MTGP image
-        html = get_mtgp_page(f"https://www.mtgpics.com/card?ref={self.mtgp_code}")
-        if(html is None):
-            return None
-        soup = BeautifulSoup(html, "html.parser")
-        soup_img = soup.find_all(
-            "img", {"style": "display:block;border:4px black solid;cursor:pointer;"}
-        )
-        return core.get_card_face(soup_img, False)
+        return core.get_card_face(self.mtgp_images, False)
 
-    @cached_property
+    @_cached
     def mtgp_path(self) -> str:
         # Path to save MTGP image download
-        path = os.path.join(cfg.mtgp, self.path) if self.path else cfg.mtgp
+        path = f"{cfg.mtgp}/{self.path}" if self.path else cfg.mtgp
         return self.generate_path(path, self.name, self.artist)
 
-    @property
+    @_cached
     def scry_url(self) -> str:
         # Download link for Scryfall art crop
         return self.c.get("image_uris", {}).get(
             "large" if cfg.download_scryfall_full else "art_crop", ""
         )
 
-    @cached_property
+    @_cached
     def scry_path(self) -> str:
         # Path to save Scryfall art crop download
-        path = os.path.join(cfg.scry, self.path) if self.path else cfg.scry
+        path = f"{cfg.scry}/{self.path}" if self.path else cfg.scry
         return self.generate_path(path, self.name, self.artist)
 
     """
@@ -210,7 +281,7 @@ class Card:
         @return: Valid path to save a file.
         """
         filename = self.naming_convention(name, artist, self.set.upper(), self.number)
-        path = os.path.join(path, f"{filename}.jpg")
+        path = f"{path}/{filename}.jpg"
         if not cfg.overwrite:
             path = self.check_path(path)
         return path
@@ -241,28 +312,16 @@ class Card:
             return [(False, self.label, self.scry_path)]
         return [(True, self.label, self.mtgp_path)]
 
-    def get_template(self):
-        template_effects = ["enchantment", "miracle", "colorshifted", "extendedart", "etched", "snow"]
-
-        if self.layout == 'token':
-            return 'token'
-        elif self.border_color == 'borderless':
-            return 'borderless'
-        elif self.frame in ('1993', '1995'):
-            return 'classic'
-        elif result := self.find_first_match(self.frame_effects, template_effects):
-            return result
-        else:
-            return 'normal'
-
+    def get_template(self) -> str:
+        """
+        Determine the template folder this card is saved under.
+        @return: Name of the template folder.
+        """
+        return get_template(self.c)
 
     """
     STATIC METHODS
     """
-    @staticmethod
-    def find_first_match(array1, array2):
-        matches = set(array1) & set(array2)  # Find common elements
-        return next(iter(matches), None)  # Return the first match or None
 
     @staticmethod
     def download_mtgp(
@@ -303,12 +362,25 @@ class Card:
         """
         Check if path needs to be numbered to prevent overwrite.
         """
+        folder, filename = os.path.split(path)
+        existing = _dir_files.get(folder)
+        if existing is None:
+            # Snapshot the folder once, then track names handed out since
+            try:
+                existing = {e.name for e in os.scandir(folder) if e.is_file()}
+            except FileNotFoundError:
+                existing = set()
+            _dir_files[folder] = existing
+
+        # Skip names known to be taken, confirming the final candidate on disk
         i = 0
-        current_path = path
-        while os.path.isfile(current_path):
+        current = filename
+        while current in existing or os.path.isfile(f"{folder}/{current}"):
+            existing.add(current)
             i += 1
-            current_path = path.replace(".jpg", f" ({str(i)}).jpg")
-        return current_path
+            current = filename.replace(".jpg", f" ({str(i)}).jpg")
+        existing.add(current)
+        return f"{folder}/{current}"
 
     @staticmethod
     def naming_convention(
@@ -322,13 +394,9 @@ class Card:
         @param card_number: Collector number of the card.
         @return: Correct filename
         """
-        result = str(
-            cfg.naming.replace("NAME", card_name)
-            .replace("ARTIST", card_artist)
-            .replace("SET", card_set)
-            .replace("NUMBER", card_number)
+        return format_filename(
+            cfg.naming, card_name, card_artist, card_set, card_number
         )
-        return str(sanitize_filename(result))
 
 
 """
@@ -345,18 +413,18 @@ class Adventure(Card):
     def name_saved(self) -> str:
         return self.c["card_faces"][0]["name"]
 
-    @cached_property
+    @_cached
     def mtgp_path(self) -> str:
         # Path to save MTGP image download
         return self.generate_path(
-            os.path.join(cfg.mtgp, self.path), self.name_saved, self.artist
+            f"{cfg.mtgp}/{self.path}", self.name_saved, self.artist
         )
 
-    @cached_property
+    @_cached
     def scry_path(self) -> str:
         # Path to save Scryfall art crop download
         return self.generate_path(
-            os.path.join(cfg.scry, self.path), self.name_saved, self.artist
+            f"{cfg.scry}/{self.path}", self.name_saved, self.artist
         )
 
     @property
@@ -374,18 +442,18 @@ class Flip(Card):
     def name_saved(self) -> str:
         return self.c["card_faces"][0]["name"]
 
-    @cached_property
+    @_cached
     def mtgp_path(self) -> str:
         # Path to save MTGP image download
         return self.generate_path(
-            os.path.join(cfg.mtgp, self.path), self.name_saved, self.artist
+            f"{cfg.mtgp}/{self.path}", self.name_saved, self.artist
         )
 
-    @cached_property
+    @_cached
     def scry_path(self) -> str:
         # Path to save Scryfall art crop download
         return self.generate_path(
-            os.path.join(cfg.scry, self.path), self.name_saved, self.artist
+            f"{cfg.scry}/{self.path}", self.name_saved, self.artist
         )
 
     @property
@@ -404,7 +472,7 @@ class MDFC(Card):
     path = ""
     path_back = ""
 
-    @property
+    @_cached
     def name(self) -> str:
         return self.c["card_faces"][0]["name"]
 
@@ -412,13 +480,13 @@ class MDFC(Card):
     def name_back(self) -> str:
         return self.c["card_faces"][1]["name"]
 
-    @property
+    @_cached
     def artist(self) -> str:
-        return self.c["card_faces"][0]["artist"]
+        return unidecode(self.c["card_faces"][0]["artist"])
 
-    @property
+    @_cached
     def artist_back(self) -> str:
-        return self.c["card_faces"][1]["artist"]
+        return unidecode(self.c["card_faces"][1]["artist"])
 
     @property
     def scry_urls(self) -> list[Optional[str]]:
@@ -429,83 +497,92 @@ class MDFC(Card):
             for n in self.c.get("card_faces", [])
         ]
 
-    @cached_property
+    @_cached
     def mtgp_urls(self) -> list[Optional[str]]:
         # Acquire best download link for MTGP image
-        r = requests.get("https://www.mtgpics.com/card?ref=" + self.mtgp_code)
-        soup = BeautifulSoup(r.content, "html.parser")
-        soup_img = soup.find_all(
-            "img", {"style": "display:block;border:4px black solid;cursor:pointer;"}
-        )
-        return [core.get_card_face(soup_img, False), core.get_card_face(soup_img, True)]
+        return [
+            core.get_card_face(self.mtgp_images, False),
+            core.get_card_face(self.mtgp_images, True),
+        ]
 
-    @cached_property
+    @_cached
     def mtgp_paths(self) -> list[str]:
         # Path to save MTGP image download
         return [
+            self.generate_path(f"{cfg.mtgp}/{self.path}", self.name, self.artist),
             self.generate_path(
-                os.path.join(cfg.mtgp, self.path), self.name, self.artist
-            ),
-            self.generate_path(
-                os.path.join(cfg.mtgp, self.path_back), self.name_back, self.artist_back
+                f"{cfg.mtgp}/{self.path_back}", self.name_back, self.artist_back
             ),
         ]
 
-    @cached_property
+    @_cached
     def scry_paths(self) -> list[str]:
         # Path to save Scryfall art crop download
         return [
+            self.generate_path(f"{cfg.scry}/{self.path}", self.name, self.artist),
             self.generate_path(
-                os.path.join(cfg.scry, self.path), self.name, self.artist
-            ),
-            self.generate_path(
-                os.path.join(cfg.scry, self.path_back), self.name_back, self.artist_back
+                f"{cfg.scry}/{self.path_back}", self.name_back, self.artist_back
             ),
         ]
 
-    @cached_property
+    @_cached
     def labels(self) -> list[str]:
         return [
             f"{self.name} ({self.set.upper()}) {self.number}",
             f"{self.name_back} ({self.set.upper()}) {self.number}",
         ]
 
-    def download(self, logging: bool = True):
+    def download(self, logging: bool = True) -> DownloadResult:
         """
-        Download each card side.
+        Download each card side, both sides at the same time.
         @param logging: Whether to log failed download attempts.
-        @return:
+        @return: List of tuple results containing success state, card label, and path.
         """
-        # Track download results
-        results = []
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            return list(
+                pool.map(
+                    partial(self.download_face, logging=logging),
+                    range(len(self.scry_urls)),
+                )
+            )
+
+    def download_face(self, i: int, logging: bool = True) -> tuple[bool, str, str]:
+        """
+        Download one card side.
+        @param i: Index of the card side, 0 for front and 1 for back.
+        @param logging: Whether to log failed download attempts.
+        @return: Tuple containing success state, card label, and path.
+        """
+        # Lookups shared by both sides are resolved by whichever side gets there first
+        with face_lock:
+            label = self.labels[i]
+            scry_url = self.scry_urls[i]
+            if cfg.only_scryfall:
+                scry_path = self.scry_paths[i]
+            else:
+                mtgp_url, mtgp_path = self.mtgp_urls[i], self.mtgp_paths[i]
 
         # Download only scryfall?
         if cfg.only_scryfall:
-            for i, scry_url in enumerate(self.scry_urls):
-                result = self.download_scryfall(
-                    scry_url, self.scry_paths[i], self.labels[i]
-                )
-                results.append((result, self.labels[i], self.scry_paths[i]))
-                if not result and logging:
-                    log_failed(self.labels[i], action="SCRY")
-            return results
+            result = self.download_scryfall(scry_url, scry_path, label)
+            if not result and logging:
+                log_failed(label, action="SCRY")
+            return result, label, scry_path
 
         # Try to download MTGP
-        for i, scry_url in enumerate(self.scry_urls):
-            result = self.download_mtgp(
-                self.mtgp_urls[i], self.mtgp_paths[i], self.labels[i]
-            )
-            if not result:
-                # Download Scryfall as a backup?
-                if cfg.download_scryfall and self.download_scryfall(
-                    scry_url, self.scry_paths[i], self.labels[i]
-                ):
-                    log_failed(self.labels[i], print_out=False)
-                elif logging:
-                    log_failed(self.labels[i])
-            results.append((result, self.labels[i], self.mtgp_paths[i]))
-
-        return results
+        result = self.download_mtgp(mtgp_url, mtgp_path, label)
+        if not result:
+            # Download Scryfall as a backup?
+            backup = False
+            if cfg.download_scryfall:
+                with face_lock:
+                    scry_path = self.scry_paths[i]
+                backup = self.download_scryfall(scry_url, scry_path, label)
+            if backup:
+                log_failed(label, print_out=False)
+            elif logging:
+                log_failed(label)
+        return result, label, mtgp_path
 
 
 class Split(MDFC):
@@ -616,6 +693,130 @@ class Meld(Card):
 UTILITY FUNCTIONS
 """
 
+# Card class for each Scryfall layout
+CARD_CLASSES = {
+    "normal": Card,
+    "transform": Transform,
+    "modal_dfc": MDFC,
+    "adventure": Adventure,
+    "leveler": Leveler,
+    "saga": Saga,
+    "planar": Planar,
+    "meld": Meld,
+    "class": Class,
+    "split": Split,
+    "flip": Flip,
+    "token": Token,
+    "reversible_card": Reversible,
+}
+
+
+def ensure_dir(path: str) -> None:
+    """
+    Create a folder if needed, only touching the filesystem once per folder.
+    @param path: Path to the folder.
+    """
+    if path not in _ensured_dirs:
+        Path(path).mkdir(mode=511, parents=True, exist_ok=True)
+        _ensured_dirs.add(path)
+
+
+def get_template(c: dict) -> str:
+    """
+    Determine the template folder a card is saved under.
+    @param c: Card json data.
+    @return: Name of the template folder.
+    """
+    if c.get("layout", "") == "token":
+        return "token"
+    if c.get("border_color", "") == "borderless":
+        return "borderless"
+    if c.get("frame", "") in CLASSIC_FRAMES:
+        return "classic"
+
+    # First frame effect with its own template folder
+    for effect in c.get("frame_effects", []):
+        if effect in TEMPLATE_EFFECTS:
+            return effect
+    return "normal"
+
+
+def preflight_dirs(cards: list[Union[str, dict]]) -> None:
+    """
+    Create the download folders for cards with known data before any download starts.
+    @param cards: Card list, only cards given as json data are considered.
+    """
+    for template in {get_template(c) for c in cards if isinstance(c, dict)}:
+        ensure_dir(f"{cfg.mtgp}/{template}")
+        ensure_dir(f"{cfg.scry}/{template}")
+
+
+def prefetch_mtgp_codes(cards: list[Union[str, dict]]) -> None:
+    """
+    Look up the MTGP codes of cards with known data before any download starts.
+    @param cards: Card list, only cards given as json data are considered.
+    """
+    lookups: list[tuple[str, str, str]] = []
+    for c in cards:
+        if isinstance(c, dict) and c.get("name"):
+            card = get_card_class(c)(c)
+            mtgp_set = card.mtgp_set
+
+            # Promo cards are searched on their promo checklist first
+            if not card.promo:
+                lookups.append((mtgp_set, card.number, card.mtgp_name))
+    core.get_mtgp_codes_bulk(lookups)
+
+
+def mtgp_set_exists(set_code: str) -> bool:
+    """
+    Check whether a set is listed on MTG Pics, probing the site once per set.
+    Failed probes aren't remembered, so the next card of the set probes again.
+    @param set_code: MTGP set code, ex: mh2
+    @return: True if the first card of the set has a page, otherwise False.
+    """
+    if set_code in mtgp_probed_sets:
+        return mtgp_probed_sets[set_code]
+    exists = get_mtgp_card_exists(f"https://www.mtgpics.com/card?ref={set_code}001")
+    if exists is None:
+        return False
+    mtgp_probed_sets[set_code] = exists
+    return exists
+
+
+@lru_cache(maxsize=None)
+def naming_template(naming: str) -> str:
+    """
+    Convert a naming convention into a format template, once per convention.
+    @param naming: Naming convention using NAME, ARTIST, SET and NUMBER.
+    @return: Template with a replacement field for each card detail.
+    """
+    return NAMING_TOKENS.sub(lambda m: NAMING_FIELDS[m.group(0)], naming)
+
+
+@lru_cache(maxsize=1024)
+def format_filename(
+    naming: str, card_name: str, card_artist: str, card_set: str, card_number: str
+) -> str:
+    """
+    Fill in a naming convention and sanitize the result, once per set of card details.
+    @param naming: Naming convention using NAME, ARTIST, SET and NUMBER.
+    @param card_name: Name of the card.
+    @param card_artist: Artist of the card.
+    @param card_set: Set code of the card.
+    @param card_number: Collector number of the card.
+    @return: Valid filename.
+    """
+    result = naming_template(naming).format_map(
+        {
+            "name": card_name,
+            "artist": card_artist,
+            "set": card_set,
+            "number": card_number,
+        }
+    )
+    return str(sanitize_filename(result))
+
 
 def get_card_class(c: dict):
     """
@@ -623,33 +824,25 @@ def get_card_class(c: dict):
     @param c: Card json data.
     @return: The correct card class to use.
     """
-    class_map = {
-        "normal": Card,
-        "transform": Transform,
-        "modal_dfc": MDFC,
-        "adventure": Adventure,
-        "leveler": Leveler,
-        "saga": Saga,
-        "planar": Planar,
-        "meld": Meld,
-        "class": Class,
-        "split": Split,
-        "flip": Flip,
-        "token": Token,
-        "reversible_card": Reversible,
-    }
-
-    # Planeswalker, saga, or land? (non mdfc)
     if not isinstance(c, dict):
         print("C VALUE: ", c)
-    if "Planeswalker" in c.get("type_line", "") and "card_faces" not in c:
-        return Planeswalker
-    if "Saga" in c.get("type_line", "") and "card_faces" not in c:
-        return Saga
+
+    # Special layouts map straight to their class
+    layout = c.get("layout", "normal")
+    if layout != "normal" and layout in CARD_CLASSES:
+        return CARD_CLASSES[layout]
+
+    # Planeswalker, saga, or land? (non mdfc)
     if "Mutate" in c.get("keywords", ""):
         return Mutate
-    if "Land" in c.get("type_line", "") and "card_faces" not in c:
-        if "Basic Land" in c.get("type_line", ""):
-            return BasicLand
-        return Land
-    return class_map.get(c.get("layout", "normal"), Card)
+    if "card_faces" not in c:
+        type_line = c.get("type_line", "")
+        if "Planeswalker" in type_line:
+            return Planeswalker
+        if "Saga" in type_line:
+            return Saga
+        if "Land" in type_line:
+            if "Basic Land" in type_line:
+                return BasicLand
+            return Land
+    return CARD_CLASSES.get(layout, Card)
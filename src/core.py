@@ -1,51 +1,92 @@
 """
 CORE FUNCTIONS
 """
+import atexit
 import json
 import os
+import re
 import zipfile
-from typing import Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+from threading import Lock, get_ident
+from typing import Any, Optional, TextIO, Union
 
-import requests
-from difflib import SequenceMatcher
 from pathlib import Path
 from colorama import Style, Fore
-from bs4 import BeautifulSoup
+import lxml.html
+import orjson
+from rapidfuzz import fuzz
+from lxml import etree
+from lxml.etree import ParserError
 from requests import RequestException
 from unidecode import unidecode
 from src import settings as cfg
 from src.constants import console
-from src.fetch import get_cards_paged, get_mtgp_page, get_moxfield_url
+from src.fetch import SESSION, get_cards_paged, get_mtgp_page, get_moxfield_url
+from src.types import ChecklistEntry, PromoEntry
 from src import card as dl
 
 cwd = os.getcwd()
 
+# Checklist pages of the MTGP promo sets
+MTGP_PROMO_CHECKLISTS = {
+    "dci": "https://mtgpics.com/set_checklist?set=18",
+    "a22": "https://mtgpics.com/set_checklist?set=375",
+    "uni": "https://mtgpics.com/set_checklist?set=201",
+    "pmo": "https://mtgpics.com/set_checklist?set=72",
+}
+
+# Everything in a collector number that isn't a digit
+NON_DIGITS = re.compile(r"\D+")
+
+# Concurrent MTGP lookups in a bulk search, fewer than the session's pooled connections
+MTGP_WORKERS = 8
+
+# Card rows on an MTGP checklist page, with the cells and links within each row
+MTGP_ROWS = etree.XPath(
+    '//div[@style="display:block;margin:0px 2px 0px 2px;border-top:1px #cccccc dotted;"]'
+)
+MTGP_CELLS = etree.XPath(".//td")
+MTGP_LINKS = etree.XPath(".//a/@href")
+
+# Open log files by name, shared by every log call in this process
+log_files: dict[str, TextIO] = {}
+log_lock = Lock()
+
+# Set checklist links found on MTGP, saved between runs
+mtgp_set_map_path = os.path.join(cwd, "logs/mtgp_set_map.json")
+
 """
 HELPERS
 """
-def find_key_values(json_obj, target_key, results=None):
+def find_key_values(json_obj, target_key):
     """
-    Recursively search a nested JSON object for all occurrences of a specific key
-    and collect their values into a list.
+    Search a nested JSON object for all occurrences of a specific key
+    and collect their values into a list, in document order.
 
     :param json_obj: The JSON object to search (dict or list).
     :param target_key: The key to search for.
-    :param results: The list to store the found values (default: None).
     :return: A list of all values corresponding to the target key.
     """
-    if results is None:
-        results = []
-
-    if isinstance(json_obj, dict):
-        for key, value in json_obj.items():
-            if key == target_key:
-                results.append(value)
-            if isinstance(value, (dict, list)):
-                find_key_values(value, target_key, results)
-    elif isinstance(json_obj, list):
-        for item in json_obj:
-            if isinstance(item, (dict, list)):
-                find_key_values(item, target_key, results)
+    results = []
+
+    # Walk with an explicit stack, pushing children in reverse to keep document order.
+    # Matched values are queued as 1-tuples, a type JSON data never contains.
+    stack = [json_obj]
+    while stack:
+        node = stack.pop()
+        kind = type(node)
+        if kind is tuple:
+            results.append(node[0])
+        elif kind is dict:
+            for key, value in reversed(node.items()):
+                if type(value) is dict or type(value) is list:
+                    stack.append(value)
+                if key == target_key:
+                    stack.append((value,))
+        elif kind is list:
+            stack.extend(reversed(node))
 
     return results
 
@@ -62,12 +103,6 @@ def normalize_card_list(cards: list[Union[str, dict]]) -> list[Union[str, dict]]
     """
     result: list[Union[str, dict]] = []
 
-    # Remove empty lines
-    if "" in cards:
-        cards.remove("")
-    if " " in cards:
-        cards.remove(" ")
-
     # Format each card
     for c in cards:
         # Analyze string card
@@ -76,9 +111,13 @@ def normalize_card_list(cards: list[Union[str, dict]]) -> list[Union[str, dict]]
             c = c.strip().replace("\n", "")
 
             # Remove inappropriate leading number
-            terms = c.split(" ")
+            terms = c.split(" ", 1)
             if len(terms[0]) < 4 and terms[0].isdigit():
-                c = " ".join(terms[1:])
+                c = terms[1] if len(terms) > 1 else ""
+
+            # Skip empty lines
+            if not c:
+                continue
         result.append(c)
     return result
 
@@ -94,10 +133,7 @@ def get_command(command: str) -> Optional[dict]:
     @param command: String representing a pre-programmed command from links.json.
     @return: The appropriate link, None if nothing matches
     """
-    for k, v in cfg.links.items():
-        if command in v:
-            return v[command]
-    return None
+    return cfg.links_flat.get(command)
 
 
 def get_list_from_link(command: dict) -> list[dict]:
@@ -108,7 +144,7 @@ def get_list_from_link(command: dict) -> list[dict]:
     """
     try:
         # Grab the card list from JSON supported API
-        cards = requests.get(command["url"]).json()
+        cards = orjson.loads(SESSION.get(command["url"], timeout=10).content)
     except (RequestException, json.JSONDecodeError):
         # Invalid data or bad request
         return []
@@ -133,17 +169,13 @@ def get_list_from_moxfield(command: str) -> Optional[list]:
     if not cards:
         return []
 
-    tokens = [token for token in data['tokens'] if token["isToken"] == True]
+    tokens = [token for token in data.get("tokens", []) if token["isToken"] == True]
 
-    merged_unique = []
-    seen = set()
-    for item in cards + tokens:
-        if item["scryfall_id"] not in seen:
-            seen.add(item["scryfall_id"])
-            merged_unique.append(item)
-
-    if not isinstance(cards, list):
-        return []
+    # Keep the first entry for each printing, in deck order
+    merged: dict[str, dict] = {}
+    for item in chain(cards, tokens):
+        merged.setdefault(item["scryfall_id"], item)
+    merged_unique = list(merged.values())
 
     if os.environ['CARD_ARCHIVE_PATH']:
         merged_unique = filter_files_from_zip(os.environ['CARD_ARCHIVE_PATH'], merged_unique)
@@ -178,6 +210,87 @@ MTGP Functions
 """
 
 
+def load_mtgp_set_map() -> dict[str, str]:
+    """
+    Load the saved set checklist links from previous runs.
+    @return: Checklist link for each MTGP set code.
+    """
+    try:
+        with open(mtgp_set_map_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_mtgp_set_map() -> None:
+    """
+    Save the known set checklist links, merged with links saved by other processes.
+    """
+    data = {**load_mtgp_set_map(), **mtgp_set_map}
+    part = f"{mtgp_set_map_path}.{os.getpid()}.{get_ident()}.part"
+    try:
+        Path(os.path.join(cwd, "logs")).mkdir(mode=511, parents=True, exist_ok=True)
+        with open(part, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(part, mtgp_set_map_path)
+    except OSError:
+        # Saving is only an optimization for future runs
+        pass
+
+
+mtgp_set_map = load_mtgp_set_map()
+
+# MTGP codes found for each (set code, collector number, name) lookup
+mtgp_codes: dict[tuple[str, str, str], str] = {}
+
+
+def get_mtgp_set_checklist(set_code: str) -> str:
+    """
+    Find the MTG Pics checklist page for a set, crawling the site only for unknown sets.
+    @param set_code: MTGP set code of the set, ex: mh2
+    @return: Link to the set checklist page.
+    """
+    if link := mtgp_set_map.get(set_code):
+        return link
+
+    # Crawl the mtgpics site to find correct set code
+    r = get_mtgp_page(f"https://www.mtgpics.com/card?ref={set_code}001")
+    tree = lxml.html.fromstring(r)
+    td = tree.xpath('//td[@width="170"][@align="center"]')[0]
+    replaced = td.xpath(".//a")[0].get("href", "").replace("set?", "set_checklist?")
+    link = f"https://mtgpics.com/{replaced}"
+
+    # Remember this set for future lookups and runs
+    mtgp_set_map[set_code] = link
+    save_mtgp_set_map()
+    return link
+
+
+@lru_cache(maxsize=64)
+def get_mtgp_set_index(
+    mtgp_link: str,
+) -> tuple[dict[str, list[ChecklistEntry]], list[ChecklistEntry]]:
+    """
+    Crawl and parse a set checklist page once, indexing its cards.
+    @param mtgp_link: Link to the set checklist page.
+    @return: (name, code) pairs grouped by collector number, and all pairs in page order.
+    """
+    r = get_mtgp_page(mtgp_link)
+    tree = lxml.html.fromstring(r)
+    by_num: dict[str, list[ChecklistEntry]] = {}
+    rows: list[ChecklistEntry] = []
+    for row in MTGP_ROWS(tree):
+        cols = MTGP_CELLS(row)
+        links = MTGP_LINKS(cols[2])
+        entry = (
+            cols[2].text_content(),
+            links[0].replace("card?ref=", "") if links else None,
+        )
+        by_num.setdefault(cols[0].text_content(), []).append(entry)
+        rows.append(entry)
+    return by_num, rows
+
+
 def get_mtgp_code(set_code: str, num: str, name: str) -> Optional[str]:
     """
     Webscrape to find the correct MTG Pics code for the card.
@@ -186,42 +299,76 @@ def get_mtgp_code(set_code: str, num: str, name: str) -> Optional[str]:
     @param name: Name of this card, ex: Damnation
     @return: Accurate mtgp linkage for this card.
     """
+    if code := mtgp_codes.get((set_code, num, name)):
+        return code
     try:
 
-        # Crawl the mtgpics site to find correct set code
-        r = get_mtgp_page(f"https://www.mtgpics.com/card?ref={set_code}001")
-        soup = BeautifulSoup(r, "html.parser")
-        soup_td = soup.find("td", {"width": "170", "align": "center"})
-        replaced = soup_td.find("a").get("href", "").replace("set?", "set_checklist?")
-        mtgp_link = f"https://mtgpics.com/{replaced}"
-
         # Crawl the set page to find the correct link
-        r = get_mtgp_page(mtgp_link)
-        soup = BeautifulSoup(r, "html.parser")
-        rows = soup.find_all(
-            "div",
-            {
-                "style": "display:block;margin:0px 2px 0px 2px;border-top:1px #cccccc dotted;"
-            },
-        )
-
-        # Look for collector number and name match
-        for row in rows:
-            cols = row.find_all("td")
-            if cols[0].text == num and name in cols[2].text:
-                return cols[2].find("a")["href"].replace("card?ref=", "")
+        by_num, rows = get_mtgp_set_index(get_mtgp_set_checklist(set_code))
 
-        # Collector number doesn't match, look only for the name
-        for row in rows:
-            cols = row.find_all("td")
-            if name in cols[2].text:
-                return cols[2].find("a")["href"].replace("card?ref=", "")
+        # Look for collector number and name match, then only for the name
+        for card_name, code in chain(by_num.get(num, []), rows):
+            if name in card_name:
+                if code:
+                    mtgp_codes[set_code, num, name] = code
+                return code
 
-    except (KeyError, TypeError, IndexError, AttributeError):
+    except (KeyError, TypeError, IndexError, AttributeError, ParserError):
         pass
     return None
 
 
+def get_mtgp_codes_bulk(
+    cards: list[tuple[str, str, str]]
+) -> dict[tuple[str, str, str], Optional[str]]:
+    """
+    Find the correct MTG Pics codes for many cards at once, looking them up concurrently.
+    @param cards: Set code, collector number and name of each card, ex: (mh2, 85, Damnation)
+    @return: MTGP code for each card, None if it couldn't be found.
+    """
+    cards = list(dict.fromkeys(cards))
+    with ThreadPoolExecutor(max_workers=MTGP_WORKERS) as pool:
+        # Parse each set checklist once before the cards within it are looked up
+        list(pool.map(warm_mtgp_set_index, {set_code for set_code, _, _ in cards}))
+        return dict(zip(cards, pool.map(lambda c: get_mtgp_code(*c), cards)))
+
+
+def warm_mtgp_set_index(set_code: str) -> None:
+    """
+    Crawl and parse the checklist of a set ahead of its card lookups.
+    @param set_code: MTGP set code of the set, ex: mh2
+    """
+    try:
+        get_mtgp_set_index(get_mtgp_set_checklist(set_code))
+    except (KeyError, TypeError, IndexError, AttributeError, ParserError):
+        pass
+
+
+@lru_cache(maxsize=8)
+def get_mtgp_promo_rows(url: str) -> list[PromoEntry]:
+    """
+    Crawl and parse a promo set checklist page once, normalizing each card for matching.
+    @param url: Link to the promo set checklist page.
+    @return: Lowercase name, ASCII artist, code and name of each card in page order.
+    """
+    r = get_mtgp_page(url)
+    tree = lxml.html.fromstring(r)
+    rows: list[PromoEntry] = []
+    for row in MTGP_ROWS(tree):
+        cols = MTGP_CELLS(row)
+        card_name = cols[2].text_content()
+        links = MTGP_LINKS(cols[2])
+        rows.append(
+            (
+                card_name.lower(),
+                unidecode(cols[6].text_content()),
+                links[0].replace("card?ref=", "") if links else None,
+                card_name,
+            )
+        )
+    return rows
+
+
 def get_mtgp_code_pmo(
     name: str, artist: str, set_name: str, promo: str = "pmo"
 ) -> Optional[str]:
@@ -235,46 +382,23 @@ def get_mtgp_code_pmo(
     """
     try:
         # Track matches
-        matches = []
+        matches: list[dict[str, Any]] = []
 
         # Which promo set?
-        if promo == "dci":
-            url = "https://mtgpics.com/set_checklist?set=18"
-        elif promo == "a22":
-            url = "https://mtgpics.com/set_checklist?set=375"
-        elif promo == "uni":
-            url = "https://mtgpics.com/set_checklist?set=201"
-        else:
-            url = "https://mtgpics.com/set_checklist?set=72"
+        url = MTGP_PROMO_CHECKLISTS.get(promo, MTGP_PROMO_CHECKLISTS["pmo"])
 
-        # Crawl the set page to find the correct link
-        r = get_mtgp_page(url)
-        soup = BeautifulSoup(r, "html.parser")
-        rows = soup.find_all(
-            "div",
-            {
-                "style": "display:block;margin:0px 2px 0px 2px;border-top:1px #cccccc dotted;"
-            },
-        )
-        for row in rows:
-            cols = row.find_all("td")
-            if (
-                artist in unidecode(cols[6].text)
-                and name.lower() in cols[2].text.lower()
-            ):
+        # Search the parsed set page for the correct link
+        name_lower = name.lower()
+        for card_lower, card_artist, code, card_name in get_mtgp_promo_rows(url):
+            if artist in card_artist and name_lower in card_lower and code:
                 matches.append(
                     {
-                        "code": cols[2]
-                        .find("a")
-                        .get("href", "")
-                        .replace("card?ref=", ""),
-                        "match": SequenceMatcher(
-                            a=cols[2].text.replace(name, ""), b=set_name
-                        ).ratio(),
+                        "code": code,
+                        "match": fuzz.ratio(card_name.replace(name, ""), set_name),
                     }
                 )
         return sorted(matches, key=lambda i: i["match"], reverse=True)[0]["code"]
-    except (KeyError, TypeError, IndexError, AttributeError):
+    except (KeyError, TypeError, IndexError, AttributeError, ParserError):
         pass
     return None
 
@@ -291,57 +415,49 @@ def get_card_face(entries: list[dict], back: bool = False) -> Optional[str]:
     if len(entries) == 0:
         return None
 
+    # Only one image, assume back is missing
+    if len(entries) == 1 and back:
+        return None
+
     # Format the image path
-    arr = []
     path = f"https://mtgpics.com/{os.path.dirname(entries[0]['src'])}"
     path = path.replace("art_th", "art")
 
-    # Isolate the image code
-    for e in entries:
-        arr.append(os.path.basename(e["src"]).replace(".jpg", ""))
+    # Isolate the image codes, sorted once for every strategy
+    arr = sorted(os.path.basename(e["src"]).replace(".jpg", "") for e in entries)
 
     # Strategy based on number of entries
     if len(arr) == 1:
-        if back:
-            # Only one image, assume back is missing
-            return None
         return f"{path}/{arr[0]}.jpg"
     if len(arr) == 2:
-        if back:
-            return f"{path}/{sorted(arr)[1]}.jpg"
-        return f"{path}/{sorted(arr)[0]}.jpg"
-    if len(arr) > 2:
-
-        # Separate into string array and int array, sorted
-        img_i = []
-        img_s = []
-        arr.sort()
-
-        for i in arr:
-            if len(i) == 3:
-                img_i.append(i)
-            elif len(i) > 3:
-                img_s.append(i)
-
-        # Try comparing ints
-        if len(img_i) > 1:
-            if back:
-                return f"{path}/{img_i[1]}.jpg"
-            return f"{path}/{img_i[0]}.jpg"
-
-        # Try comparing strings
-        if len(img_s) > 1:
-            if back:
-                return f"{path}/{img_s[1]}.jpg"
-            return f"{path}/{img_s[0]}.jpg"
-
-        # Or just go in order
-        if back:
-            return f"{path}/{img_i[0]}.jpg"
-        return f"{path}/{img_s[0]}.jpg"
+        return f"{path}/{arr[1] if back else arr[0]}.jpg"
+
+    # Find the first two int codes and first two string codes in one pass
+    first_i = second_i = first_s = second_s = None
+    for code in arr:
+        if len(code) == 3:
+            if first_i is None:
+                first_i = code
+            elif second_i is None:
+                second_i = code
+        elif len(code) > 3:
+            if first_s is None:
+                first_s = code
+            elif second_s is None:
+                second_s = code
+
+    # Try comparing ints, then strings, or just go in order
+    if second_i is not None:
+        code = second_i if back else first_i
+    elif second_s is not None:
+        code = second_s if back else first_s
+    else:
+        code = first_i if back else first_s
 
     # Finally, couldn't match anything
-    return None
+    if code is None:
+        return None
+    return f"{path}/{code}.jpg"
 
 
 """
@@ -363,6 +479,36 @@ def log_scryfall(label: str) -> None:
     console.print(f"{Fore.YELLOW}SCRYFALL:{Style.RESET_ALL} {label}")
 
 
+def get_log_file(filename: str) -> TextIO:
+    """
+    Get the open handle for a log file, opening it on first use.
+    @param filename: Name of the log file.
+    @return: Log file opened for appending.
+    """
+    if f := log_files.get(filename):
+        return f
+    with log_lock:
+        if filename not in log_files:
+            Path(os.path.join(cwd, "logs")).mkdir(mode=511, parents=True, exist_ok=True)
+            log_files[filename] = open(
+                os.path.join(cwd, f"logs/{filename}.txt"), "a", encoding="utf-8"
+            )
+        return log_files[filename]
+
+
+def close_log_files() -> None:
+    """
+    Close every open log file.
+    """
+    with log_lock:
+        for f in log_files.values():
+            f.close()
+        log_files.clear()
+
+
+atexit.register(close_log_files)
+
+
 def log_failed(
     label: str,
     print_out: bool = True,
@@ -379,11 +525,11 @@ def log_failed(
     @param action: The particular action that failed (MTGP or SCRY)
     """
     if write_log:
-        Path(os.path.join(cwd, "logs")).mkdir(mode=511, parents=True, exist_ok=True)
-        with open(
-            os.path.join(cwd, f"logs/{filename}.txt"), "a", encoding="utf-8"
-        ) as f:
+        f = get_log_file(filename)
+        with log_lock:
+            # Flush right away, pool workers exit without running atexit hooks
             f.write(f"{label}\n")
+            f.flush()
     if print_out:
         console.print(f"{Fore.RED}{action} FAILED:{Style.RESET_ALL} {label}")
 
@@ -396,8 +542,8 @@ def filter_files_from_zip(zip_path, cards: list[dict]):
 
     # Open the ZIP archive
     with zipfile.ZipFile(zip_path, 'r') as zip_file:
-        # Get a list of all files in the ZIP archive
-        zip_file_basenames = {os.path.splitext(os.path.basename(f))[0] for f in zip_file.namelist()}
+        # Get the name, without folders or extension, of every file in the ZIP archive
+        zip_file_basenames = {get_zip_basename(f) for f in zip_file.namelist()}
 
         # Filter out dictionaries whose filenames exist in the ZIP archive
         filtered_list = [
@@ -407,25 +553,40 @@ def filter_files_from_zip(zip_path, cards: list[dict]):
 
     return filtered_list
 
+
+def get_zip_basename(path: str) -> str:
+    """
+    Get the name of a file in a ZIP archive, without its folders or extension.
+    @param path: Path of the file within the archive.
+    @return: Base name of the file.
+    """
+    # ZIP archives always separate folders with a forward slash
+    name = path.rpartition("/")[2]
+    stem, dot, _ = name.rpartition(".")
+    return stem if dot else name
+
+
 def is_card_in_zip(card, zip_file_basenames):
     # Try to download the card
     card_class = dl.get_card_class(card)
-    name = getattr(card_class(card), "name_saved", None) or card_class(card).name
-    name_back = getattr(card_class(card), "name_back", None)
+    card_obj = card_class(card)
+    name = getattr(card_obj, "name_saved", None) or card_obj.name
+    name_back = getattr(card_obj, "name_back", None)
 
     renders = [name]
     if name_back and card['layout'] != 'adventure':
       renders.append(name_back)
 
-    return all(is_render_in_zip(render, card, zip_file_basenames) for render in renders)
-
-def is_render_in_zip(render,card, zip_file_basenames):
-    # Step 1: Construct the card's filename
+    # Set code and collector number are shared by every render of the card
     card_number = card.get('cn') or card.get('collector_number')
+    card_number_digits = NON_DIGITS.sub("", card_number)  # Extract numeric part
+    card_suffix = f"[{card['set'].upper()}] {{{int(card_number_digits)}}}"
 
-    card_number_digits = ''.join(char for char in card_number if char.isdigit())  # Extract numeric part
+    return all(
+        is_render_in_zip(render, card_suffix, zip_file_basenames) for render in renders
+    )
 
-    constructed_name = f"{render} [{card['set'].upper()}] {{{int(card_number_digits)}}}"
 
-    # Step 2: Check if constructed name is in the zip base names
-    return constructed_name in zip_file_basenames
\ No newline at end of file
+def is_render_in_zip(render, card_suffix, zip_file_basenames):
+    # Check if the constructed name is in the zip base names
+    return f"{render} {card_suffix}" in zip_file_basenames
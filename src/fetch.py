@@ -5,16 +5,47 @@ import json
 import os
 from typing import Callable, Optional, Any
 
+import orjson
 import requests
 from backoff import on_exception, expo
 from ratelimit import RateLimitDecorator, sleep_and_retry
 from requests import RequestException
+from src.__version__ import version
 
 # RateLimiter objects
 scryfall_rate_limit = RateLimitDecorator(calls=20, period=1)
 mtgp_rate_limit = RateLimitDecorator(calls=20, period=1)
 moxfield_rate_limit = RateLimitDecorator(calls=1, period=1)
 
+# Bytes read per write when saving images, a multiple of the page size
+IMAGE_CHUNK_SIZE = 65536
+
+
+"""
+SESSION
+"""
+
+
+def mount_adapters(session: requests.Session) -> None:
+    """
+    Mount fresh pooled connection adapters on a session.
+    @param session: Session to mount the adapters on.
+    """
+    # Retries are left to the rate limited request decorators
+    adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+# Shared session, reuses keep-alive connections across requests
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = f"MTG-Art-Downloader/{version}"
+mount_adapters(SESSION)
+
+# Forked workers must not share pooled sockets with the parent process
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: mount_adapters(SESSION))
+
 
 """
 DECORATORS
@@ -114,9 +145,9 @@ def get_moxfield_url(url: str, params: Optional[dict[str, str]] = None) -> dict:
         "User-Agent": os.getenv("USER_AGENT_SECRET")
     }
 
-    with requests.get(url, params=(params or {}), headers=headers) as response:
+    with SESSION.get(url, params=(params or {}), headers=headers) as response:
         if response.status_code == 200:
-            return response.json() or {}
+            return orjson.loads(response.content) or {}
         return {}
 
 
@@ -133,9 +164,9 @@ def get_data_url(url: str, params: Optional[dict[str, str]] = None) -> dict:
     @param params: Params to pass to an API endpoint.
     @return: JSON data returned.
     """
-    with requests.get(url, params=(params or {})) as response:
+    with SESSION.get(url, params=(params or {})) as response:
         if response.status_code == 200:
-            return response.json() or {}
+            return orjson.loads(response.content) or {}
         return {}
 
 
@@ -147,9 +178,9 @@ def get_scryfall_set(code: str) -> dict:
     @param code: MTG set code, ex: MH2
     @return: Set data as dict.
     """
-    with requests.get(f"https://api.scryfall.com/sets/{code}") as response:
+    with SESSION.get(f"https://api.scryfall.com/sets/{code}") as response:
         if response.status_code == 200:
-            data = response.json() or {}
+            data = orjson.loads(response.content) or {}
             return data if data.get("object") == "set" else {}
         return {}
 
@@ -163,11 +194,11 @@ def get_scryfall_card_named(name: str, code: str) -> dict:
     @param code: Set code of the card.
     @return: Card data as dict.
     """
-    with requests.get(
+    with SESSION.get(
         f"https://api.scryfall.com/cards/named", params={"fuzzy": name, "set": code}
     ) as response:
         if response.status_code == 200:
-            data = response.json() or {}
+            data = orjson.loads(response.content) or {}
             return data if data.get("object", "error") != "error" else {}
         return {}
 
@@ -181,9 +212,9 @@ def get_scryfall_card_numbered(code: str, number: str) -> dict:
     @param number: Collector number of the card.
     @return: Card data as dict.
     """
-    with requests.get(f"https://api.scryfall.com/cards/{code}/{number}") as response:
+    with SESSION.get(f"https://api.scryfall.com/cards/{code}/{number}") as response:
         if response.status_code == 200:
-            data = response.json() or {}
+            data = orjson.loads(response.content) or {}
             return data if data.get("object", "error") != "error" else {}
         return {}
 
@@ -196,11 +227,9 @@ def get_scryfall_image(url: str, path: str):
     @param path: Path to save the image.
     @return: True if successful, False if failed.
     """
-    with requests.get(url) as response:
+    with SESSION.get(url, stream=True) as response:
         if response.status_code == 200:
-            with open(path, "wb") as f:
-                f.write(response.content)
-
+            save_image(response, path)
             return True
         return False
 
@@ -218,10 +247,9 @@ def get_mtgp_image(url: str, path: str):
     @param path: Path to save the image.
     @return: True if successful, False if failed.
     """
-    with requests.get(url) as response:
+    with SESSION.get(url, stream=True) as response:
         if response.status_code == 200:
-            with open(path, "wb") as f:
-                f.write(response.content)
+            save_image(response, path)
             return True
         return False
 
@@ -233,7 +261,7 @@ def get_mtgp_page(url: str) -> Optional[bytes]:
     @param url: URL to the page.
     @return: Either the page as bytes or an empty string if failed.
     """
-    with requests.get(url) as response:
+    with SESSION.get(url) as response:
         if response.status_code == 200:
             if "Wrong ref or number." not in response.text:
                 if "No card found." not in response.text:
@@ -241,11 +269,50 @@ def get_mtgp_page(url: str) -> Optional[bytes]:
         return None
 
 
+@handle_mtgp_request(None)
+def get_mtgp_card_exists(url: str) -> Optional[bool]:
+    """
+    Check whether a card page on MTGPics lists a card.
+    @param url: URL to the card page.
+    @return: True if the card exists, False if it doesn't, None if the request failed.
+    """
+    with SESSION.get(url) as response:
+        if response.status_code == 200:
+            return (
+                "Wrong ref or number." not in response.text
+                and "No card found." not in response.text
+            )
+        return None
+
+
 """
 UTILITY FUNCTIONS
 """
 
 
+def save_image(response: requests.Response, path: str) -> None:
+    """
+    Stream a downloaded image to disk in fixed size chunks.
+    Writes to a temporary .part file first, so an interrupted download never
+    leaves a partial image at the final path.
+    @param response: Streamed response containing the image.
+    @param path: Path to save the image.
+    """
+    part = f"{path}.part"
+    try:
+        with open(part, "wb") as f:
+            for chunk in response.iter_content(chunk_size=IMAGE_CHUNK_SIZE):
+                f.write(chunk)
+        os.replace(part, path)
+    except BaseException:
+        # Don't leave the partial download behind
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+
+
 def get_cards_paged(
     url: str,
     params: Optional[dict[str, str]] = None,
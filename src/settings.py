@@ -20,6 +20,13 @@ with open(os.path.join(cwd, "src/codes.hjson"), "r", encoding="utf-8") as js:
 with open(os.path.join(cwd, "src/links.json"), "r", encoding="utf-8") as js:
     links = json.load(js)
 
+# Every command in links.json, the first category listing a command wins
+links_flat: dict[str, dict] = {
+    command: link
+    for category in reversed(links.values())
+    for command, link in category.items()
+}
+
 """
 FILES AND FOLDERS
 """
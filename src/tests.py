@@ -2,6 +2,7 @@
 BASIC PYTEST MODULE
 """
 import os
+import random
 import sys
 from pathlib import Path
 
@@ -45,6 +46,41 @@ def test_scryfall_command():
     assert all([result for result, name in dl.start()])
 
 
+def test_naming_template():
+    template = app.dl.naming_template("NAME (ARTIST) [SET] {NUMBER}")
+    assert (
+        template.format(name="Damnation", artist="Volkan Baga", set="MH2", number="85")
+        == "Damnation (Volkan Baga) [MH2] {85}"
+    )
+
+
+def test_normalize_card_list():
+    cards = ["", " ", "4 Lightning Bolt\n", "12", "1000 Cranes", "Sol Ring"]
+    assert core.normalize_card_list(cards) == [
+        "Lightning Bolt",
+        "1000 Cranes",
+        "Sol Ring",
+    ]
+
+
+def test_card_class_dispatch():
+    meld_land = {"layout": "meld", "type_line": "Legendary Land"}
+    land_token = {"layout": "token", "type_line": "Token Land — Desert"}
+    planeswalker = {"layout": "normal", "type_line": "Legendary Planeswalker — Jace"}
+    basic_land = {"layout": "normal", "type_line": "Basic Land — Forest"}
+    mutate = {
+        "layout": "normal",
+        "type_line": "Creature — Beast",
+        "keywords": ["Mutate"],
+    }
+
+    assert app.dl.get_card_class(meld_land) is app.dl.Meld
+    assert app.dl.get_card_class(land_token) is app.dl.Token
+    assert app.dl.get_card_class(planeswalker) is app.dl.Planeswalker
+    assert app.dl.get_card_class(basic_land) is app.dl.BasicLand
+    assert app.dl.get_card_class(mutate) is app.dl.Mutate
+
+
 def test_mtgp_image_determination():
     longer_string_test = [
         {"src": "pics/art_th/mh2/030b.jpg"},
@@ -84,3 +120,92 @@ def test_mtgp_image_determination():
     assert bigger_number_test == ["050.jpg", "051.jpg"]
     assert underscore_letter_test == ["030_a.jpg", "030_b.jpg"]
     assert underscore_number_test == ["030_1.jpg", "030_2.jpg"]
+
+
+def test_mtgp_codes_bulk(monkeypatch):
+    row = (
+        '<div style="display:block;margin:0px 2px 0px 2px;border-top:1px #cccccc dotted;">'
+        '<table><tr><td>{}</td><td></td><td><a href="card?ref={}">{}</a></td></tr></table>'
+        "</div>"
+    )
+    page = "<html><body>{}{}</body></html>".format(
+        row.format("85", "mh2085", "Damnation"),
+        row.format("86", "mh2086", "Dauthi Voidwalker"),
+    )
+    monkeypatch.setattr(core, "get_mtgp_page", lambda url: page.encode())
+    monkeypatch.setattr(core, "mtgp_codes", {})
+    monkeypatch.setitem(core.mtgp_set_map, "tst", "https://mtgpics.com/test_checklist")
+
+    codes = core.get_mtgp_codes_bulk(
+        [
+            ("tst", "85", "Damnation"),
+            ("tst", "1", "Dauthi Voidwalker"),
+            ("tst", "2", "Nope"),
+        ]
+    )
+    assert codes == {
+        ("tst", "85", "Damnation"): "mh2085",
+        ("tst", "1", "Dauthi Voidwalker"): "mh2086",
+        ("tst", "2", "Nope"): None,
+    }
+    assert core.mtgp_codes == {
+        ("tst", "85", "Damnation"): "mh2085",
+        ("tst", "1", "Dauthi Voidwalker"): "mh2086",
+    }
+
+
+def test_check_path_numbering(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.dl, "_dir_files", {})
+    (tmp_path / "A.jpg").touch()
+    (tmp_path / "A (1).jpg").touch()
+
+    # Existing files are skipped, names handed out stay reserved
+    assert app.dl.Card.check_path(f"{tmp_path}/A.jpg") == f"{tmp_path}/A (2).jpg"
+    assert app.dl.Card.check_path(f"{tmp_path}/A.jpg") == f"{tmp_path}/A (3).jpg"
+    assert app.dl.Card.check_path(f"{tmp_path}/B.jpg") == f"{tmp_path}/B.jpg"
+    assert app.dl.Card.check_path(f"{tmp_path}/B.jpg") == f"{tmp_path}/B (1).jpg"
+
+    # Files written after the folder snapshot are still found on disk
+    (tmp_path / "A (4).jpg").touch()
+    assert app.dl.Card.check_path(f"{tmp_path}/A.jpg") == f"{tmp_path}/A (5).jpg"
+
+
+def test_find_key_values_order():
+    data = {
+        "card": {"name": "A", "card": "B"},
+        "boards": [{"card": "C"}, [{"x": {"card": "D"}}], "card"],
+        "tokens": {"card": ["E", {"card": "F"}]},
+    }
+    assert core.find_key_values(data, "card") == [
+        {"name": "A", "card": "B"},
+        "B",
+        "C",
+        "D",
+        ["E", {"card": "F"}],
+        "F",
+    ]
+
+    # Same values in the same order as a plain recursive walk
+    def walk(node, results):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "card":
+                    results.append(value)
+                walk(value, results)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, results)
+        return results
+
+    def build(rng, depth):
+        if depth == 0 or rng.random() < 0.3:
+            return rng.randint(0, 9)
+        if rng.random() < 0.5:
+            return [build(rng, depth - 1) for _ in range(rng.randint(0, 3))]
+        keys = rng.sample(["card", "a", "b", "c"], rng.randint(0, 3))
+        return {k: build(rng, depth - 1) for k in keys}
+
+    rng = random.Random(0)
+    for _ in range(200):
+        data = build(rng, 5)
+        assert core.find_key_values(data, "card") == walk(data, [])
@@ -1,5 +1,12 @@
 """
 TYPE DEFINITIONS
 """
+from typing import Optional
 
 DownloadResult = list[tuple[bool, str, str]]
+
+# Card listed on an MTGP set checklist, as its name and MTGP code
+ChecklistEntry = tuple[str, Optional[str]]
+
+# Card listed on an MTGP promo checklist, as its lowercase name, ASCII artist, MTGP code and name
+PromoEntry = tuple[str, str, Optional[str], str]